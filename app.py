@@ -1,9 +1,28 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Optional
-import re
+from typing import Dict, List, Optional
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# motor de busca: o caminho pandas afinado (sombra lowercase, códigos
+# categóricos, índice de busca exata) é o padrão; o plano DuckDB é opt-in
+# via ENTERPRISESEARCH_ENGINE=duckdb e exige o pacote instalado
+USE_DUCKDB = (
+    duckdb is not None
+    and os.environ.get("ENTERPRISESEARCH_ENGINE", "").lower() == "duckdb"
+)
 
 # sua função atual para listar arquivos
 def list_files(dir_path: str, extension: Optional[str] = None, recursive: bool = True) -> List[str]:
@@ -21,21 +40,141 @@ def list_files(dir_path: str, extension: Optional[str] = None, recursive: bool =
         pattern = "**/*" if recursive else "*"
     return [str(p.resolve()) for p in base.rglob(pattern) if p.is_file()]
 
-files = list_files("Arquivos", ".csv")
+@st.cache_data(ttl=60, show_spinner=False)
+def _csv_files(dir_path: str, dir_mtime_ns: int) -> List[str]:
+    """
+    Lista cacheada dos CSVs. O mtime do diretório entra na chave do cache,
+    então criar/remover arquivo invalida na hora; nos demais reruns o rglob
+    (milhares de stat() em árvores grandes) nem executa.
+    """
+    return list_files(dir_path, ".csv")
+
+# sem o diretório, segue com lista vazia (o app mostra "Nenhum dado
+# encontrado."), como o rglob original fazia — o stat não pode explodir aqui
+files = (
+    _csv_files("Arquivos", os.stat("Arquivos").st_mtime_ns)
+    if Path("Arquivos").is_dir()
+    else []
+)
+
+# diretório onde guardamos a versão Parquet de cada CSV (ler Parquet dispensa
+# o parse do CSV e é muito mais rápido nos próximos cold starts)
+CACHE_DIR = Path("Arquivos") / ".cache"
+
+# colunas de filtro fixas da sidebar: baixa cardinalidade, viram categóricas
+COLUNAS_FILTRO = ["SITUAÇÃO ESPECIAL", "DESCRIÇÃO", "NOME SETOR"]
+
+# colunas que o app realmente consulta nos filtros e na busca típica: a sombra
+# lowercase só é materializada para elas (as demais são raras e caem no
+# fallback de filter_data, que normaliza sob demanda)
+USED_COLS = ("CNPJ",) + tuple(COLUNAS_FILTRO)
+
+def _csv_to_parquet(arquivo: str) -> Path:
+    """
+    Garante que exista um Parquet (snappy) atualizado para o CSV dado e
+    retorna o caminho dele. O nome do cache inclui o mtime do CSV, então
+    se o CSV mudar o cache antigo é descartado e reconvertido.
+    """
+    src = Path(arquivo)
+    dst = CACHE_DIR / f"{src.stem}.{src.stat().st_mtime_ns}.parquet"
+    if not dst.exists():
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # remove caches de versões antigas do mesmo CSV
+        for antigo in CACHE_DIR.glob(f"{src.stem}.*.parquet"):
+            antigo.unlink(missing_ok=True)
+        # conversão em streaming, chunk a chunk: o pico de memória fica
+        # limitado pelo chunksize mesmo para CSVs maiores que a RAM.
+        # strings Arrow em vez de objetos Python: ~4x menos memória e as
+        # operações .str.* despacham para os kernels vetorizados do Arrow
+        reader = pd.read_csv(src, sep=";", encoding="utf-8",
+                             dtype=pd.ArrowDtype(pa.string()), chunksize=500_000)
+        tmp = dst.with_suffix(".tmp")
+        writer = None
+        try:
+            for chunk in reader:
+                chunk["_arquivo"] = src.name
+                batch = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp, batch.schema, compression="snappy")
+                writer.write_table(batch)
+            if writer is None:
+                # CSV só com cabeçalho: grava um Parquet vazio com o schema certo
+                vazio = pd.read_csv(src, sep=";", encoding="utf-8",
+                                    dtype=pd.ArrowDtype(pa.string()), nrows=0)
+                table = pa.Table.from_pandas(vazio, preserve_index=False)
+                table = table.append_column("_arquivo", pa.array([], type=pa.string()))
+                pq.write_table(table, tmp, compression="snappy")
+        finally:
+            if writer is not None:
+                writer.close()
+        # rename atômico: um cache parcial nunca fica visível com o nome final
+        tmp.replace(dst)
+    return dst
 
 @st.cache_data
-def load_all_data(files: List[str]) -> pd.DataFrame:
-    """Carrega todos os arquivos CSV num único DataFrame, com coluna indicando o arquivo."""
-    dfs = []
-    for arquivo in files:
-        df = pd.read_csv(arquivo, sep=";", encoding="utf-8", dtype=str, low_memory=False)
-        df["_arquivo"] = Path(arquivo).name
-        dfs.append(df)
-    if dfs:
-        full = pd.concat(dfs, ignore_index=True)
+def load_all_data(files: List[str]):
+    """
+    Carrega todos os arquivos CSV num único DataFrame, com coluna indicando o arquivo.
+    Retorna (df_all, df_lower, cat_codes):
+      - df_lower é uma "sombra" com as colunas de USED_COLS já normalizadas
+        para lowercase — calculada uma única vez aqui, para que filter_data
+        não precise reprocessar milhões de strings a cada clique;
+      - as colunas de COLUNAS_FILTRO viram categóricas (códigos inteiros
+        compactos) e cat_codes mapeia, por coluna, categoria -> código.
+    """
+    if not files:
+        return pd.DataFrame(), pd.DataFrame(), {}
+    # converte em paralelo: o tokenizador de CSV do pandas solta o GIL,
+    # então threads sobrepõem IO de disco com parsing
+    with ThreadPoolExecutor(max_workers=min(8, len(files))) as ex:
+        caches = list(ex.map(_csv_to_parquet, files))
+    # um único dataset columnar: lê todos os Parquet de uma vez, sem concat;
+    # o schema unificado preserva colunas que só existem em alguns CSVs
+    # (sem ele o dataset herdaria apenas o schema do primeiro fragmento).
+    # self_destruct libera os buffers Arrow conforme são entregues ao pandas,
+    # evitando manter tabela e DataFrame inteiros em memória ao mesmo tempo
+    schema = pa.unify_schemas([pq.read_schema(cache) for cache in caches])
+    table = ds.dataset(caches, format="parquet", schema=schema).to_table()
+    df_all = table.to_pandas(
+        split_blocks=True, self_destruct=True, types_mapper=pd.ArrowDtype
+    )
+    del table
+    if USE_DUCKDB:
+        # o plano DuckDB não lê a sombra nem os códigos do caminho pandas:
+        # não pagar o build (nem o pickle por rerun) dessas estruturas
+        df_lower = pd.DataFrame()
     else:
-        full = pd.DataFrame()
-    return full
+        # projeção de colunas: a sombra cobre só USED_COLS, não a tabela
+        # inteira — corta pela metade a memória residente sem perder
+        # nenhuma funcionalidade
+        df_lower = df_all[[c for c in USED_COLS if c in df_all.columns]].apply(
+            lambda s: s.str.lower()
+        )
+    cat_codes = {}
+    for c in COLUNAS_FILTRO:
+        if c in df_all.columns:
+            # categórica também em df_all: as categorias ordenadas servem de
+            # opções da sidebar sem nenhum scan de unique()
+            df_all[c] = df_all[c].astype("category")
+            if c in df_lower.columns:
+                df_lower[c] = df_lower[c].astype("category")
+                cat_codes[c] = {cat: code for code, cat in enumerate(df_lower[c].cat.categories)}
+    return df_all, df_lower, cat_codes
+
+
+@st.cache_resource(show_spinner=False)
+def _search_index(files: List[str]) -> Dict[str, Dict]:
+    """
+    Índice de busca exata: por coluna da sombra, valor lowercase -> posições
+    das linhas. Vive em st.cache_resource (o mesmo objeto é servido a todos
+    os reruns, sem cópia): para colunas quase únicas como CNPJ o índice tem
+    ~1 array por linha, e dentro de st.cache_data cada interação re-
+    desserializaria milhões de objetos minúsculos. Somente leitura.
+    """
+    _, df_lower, _ = load_all_data(files)
+    return {
+        c: df_lower.groupby(c, observed=True).indices for c in df_lower.columns
+    }
 
 # Função de busca/filtro múltiplo
 from typing import Optional, List, Dict
@@ -47,18 +186,30 @@ def filter_data(
     column_for_search: Optional[str] = None,
     query: Optional[str] = None,
     exact_match: bool = True,
-    debug: bool = False
+    debug: bool = False,
+    df_lower: Optional[pd.DataFrame] = None,
+    cat_codes: Optional[Dict[str, Dict[str, int]]] = None,
+    search_index: Optional[Dict[str, Dict]] = None
 ) -> pd.DataFrame:
     """
     Aplica múltiplos filtros (filtros: coluna -> lista de valores OU valor único).
     Ignora filtros vazios (None, "", empty list/tuple/set).
     Faz comparações case-insensitive (normaliza para str.lower()).
     Se column_for_search e query forem passados, aplica busca textual (exata ou 'contains', case-insensitive).
+    Se df_lower (sombra pré-lowercase de df, vinda de load_all_data) for passado,
+    as comparações usam essa sombra em vez de recalcular str.lower() por chamada.
     """
-    df2 = df.copy()
+    def _col_lower(col: str) -> pd.Series:
+        if df_lower is not None and col in df_lower.columns:
+            return df_lower[col]
+        return df[col].str.lower()
+
+    # máscara booleana única acumulada com &=; o DataFrame só é fatiado uma vez
+    # no final — nada de cópias intermediárias a cada filtro
+    mask = np.ones(len(df), dtype=bool)
     if debug:
         steps = []
-        steps.append(("initial", len(df2)))
+        steps.append(("initial", len(df)))
 
     for col, val in (filtros or {}).items():
         # pular filtros vazios
@@ -70,64 +221,166 @@ def filter_data(
             continue
 
         # pular se coluna não existe
-        if col not in df2.columns:
+        if col not in df.columns:
             if debug:
-                steps.append((f"skip_missing_col:{col}", len(df2)))
+                steps.append((f"skip_missing_col:{col}", int(mask.sum())))
             continue
 
-        # normalizar coluna para string lowercase (não altera df original porque df2 é cópia)
-        df2[col] = df2[col].astype(str).str.lower()
+        # máscara calculada sobre a sombra lowercase; nenhuma coluna é mutada
+        col_lower = _col_lower(col)
 
         # normalizar valores do filtro
         if isinstance(val, (list, tuple, set)):
             val_norm = [str(v).lower() for v in val]
-            df2 = df2[df2[col].isin(val_norm)]
         else:
-            v_norm = str(val).lower()
-            df2 = df2[df2[col] == v_norm]
+            val_norm = [str(val).lower()]
+
+        if isinstance(col_lower.dtype, pd.CategoricalDtype):
+            # coluna categórica: traduz a seleção para códigos inteiros e
+            # compara código contra código (int compacto, SIMD-friendly)
+            codigos = (cat_codes or {}).get(col)
+            if codigos is None:
+                codigos = {cat: code for code, cat in enumerate(col_lower.cat.categories)}
+            sel = np.fromiter(
+                (codigos[v] for v in val_norm if v in codigos), dtype=np.int64
+            )
+            # kind="table": lookup table do tamanho do intervalo de códigos,
+            # varredura linear sem hash nem sort — O(linhas) e branchless
+            mask &= np.isin(col_lower.cat.codes.to_numpy(), sel, kind="table")
+        else:
+            mask &= col_lower.isin(val_norm).to_numpy()
 
         if debug:
-            steps.append((f"after_filter:{col}", len(df2)))
+            steps.append((f"after_filter:{col}", int(mask.sum())))
 
         # se ficou vazio, pode interromper cedo
-        if df2.empty:
+        if not mask.any():
             if debug:
                 steps.append(("early_exit_empty", 0))
-            return df2
+            return df.iloc[0:0].drop(columns=["_arquivo"], errors="ignore")
 
     # busca textual opcional
     if column_for_search and query:
-        if column_for_search in df2.columns:
+        if column_for_search in df.columns:
             q = str(query).lower()
-            df2[column_for_search] = df2[column_for_search].astype(str).str.lower()
-            if exact_match:
-                df2 = df2[df2[column_for_search] == q]
+            if exact_match and search_index is not None and column_for_search in search_index:
+                # índice pré-computado: lookup O(1) das posições, sem scan
+                # (nem o str.lower() da coluna é necessário aqui)
+                rows = search_index[column_for_search].get(q)
+                sub = np.zeros(len(df), dtype=bool)
+                if rows is not None:
+                    sub[rows] = True
+                mask &= sub
             else:
-                df2 = df2[df2[column_for_search].str.contains(q, na=False)]
+                col_lower = _col_lower(column_for_search)
+                if exact_match:
+                    mask &= (col_lower == q).fillna(False).to_numpy()
+                elif isinstance(col_lower.dtype, pd.CategoricalDtype):
+                    # basta procurar o substring nas categorias (poucas) e depois
+                    # casar os códigos — nunca nas milhões de linhas
+                    hits = pa.compute.match_substring(pa.array(col_lower.cat.categories), q)
+                    sel = np.flatnonzero(hits.to_numpy(zero_copy_only=False))
+                    mask &= np.isin(col_lower.cat.codes.to_numpy(), sel, kind="table")
+                else:
+                    # match_substring é um byte-scan vetorizado sobre o buffer Arrow
+                    # contíguo — sem regex nem chamada Python por elemento
+                    hits = pa.compute.match_substring(pa.array(col_lower, from_pandas=True), q)
+                    mask &= pa.compute.fill_null(hits, False).to_numpy(zero_copy_only=False)
             if debug:
-                steps.append((f"after_search:{column_for_search}", len(df2)))
+                steps.append((f"after_search:{column_for_search}", int(mask.sum())))
         else:
             if debug:
-                steps.append((f"search_col_missing:{column_for_search}", len(df2)))
+                steps.append((f"search_col_missing:{column_for_search}", int(mask.sum())))
 
     if debug:
         # opcional: retornar info de debug (aqui só printamos; no Streamlit use st.write)
         for name, cnt in steps:
             print(f"{name}: {cnt}")
 
-    return df2
+    return df.loc[mask].drop(columns=["_arquivo"], errors="ignore")
+
+
+@st.cache_data
+def sidebar_options(files: List[str]) -> Dict[str, List[str]]:
+    """
+    Opções dos multiselects da sidebar, por coluna de filtro. Como as colunas
+    são categóricas, isto é só list(categories) — mas cachear evita refazer
+    as listas (e repassar o DataFrame) a cada rerun de widget.
+    """
+    df_all, _, _ = load_all_data(files)
+    return {
+        col: list(df_all[col].cat.categories)
+        for col in COLUNAS_FILTRO
+        if col in df_all.columns
+    }
+
+
+@st.cache_resource
+def _duckdb_con():
+    """Conexão DuckDB em memória compartilhada entre reruns."""
+    return duckdb.connect()
+
+
+def filter_data_duckdb(
+    con,
+    df: pd.DataFrame,
+    filtros: Dict[str, Optional[object]],
+    column_for_search: Optional[str] = None,
+    query: Optional[str] = None,
+    exact_match: bool = True
+) -> pd.DataFrame:
+    """
+    Mesma semântica de filter_data, executada como um único plano columnar
+    vetorizado no DuckDB (sem cópias intermediárias em pandas). Os valores
+    do usuário entram só como parâmetros — nada é interpolado no SQL.
+    """
+    con.register("data", df)
+    conds = []
+    params: List[object] = []
+
+    def _ident(col: str) -> str:
+        return '"' + col.replace('"', '""') + '"'
+
+    for col, val in (filtros or {}).items():
+        if val is None:
+            continue
+        if isinstance(val, (list, tuple, set)) and len(val) == 0:
+            continue
+        if isinstance(val, str) and val == "":
+            continue
+        if col not in df.columns:
+            continue
+        if isinstance(val, (list, tuple, set)):
+            val_norm = [str(v).lower() for v in val]
+        else:
+            val_norm = [str(val).lower()]
+        conds.append(f"lower({_ident(col)}) IN ({', '.join('?' * len(val_norm))})")
+        params.extend(val_norm)
+
+    if column_for_search and query and column_for_search in df.columns:
+        q = str(query).lower()
+        if exact_match:
+            conds.append(f"lower({_ident(column_for_search)}) = ?")
+        else:
+            conds.append(f"contains(lower({_ident(column_for_search)}), ?)")
+        params.append(q)
+
+    sql = "SELECT * FROM data"
+    if conds:
+        sql += " WHERE " + " AND ".join(conds)
+    resultado = con.execute(sql, params).to_arrow_table()
+    return resultado.to_pandas(types_mapper=pd.ArrowDtype).drop(
+        columns=["_arquivo"], errors="ignore"
+    )
 
 
 st.title("App de Pesquisa e Filtros")
 # carregando dados
-df_all = load_all_data(files)
+df_all, df_lower, cat_codes = load_all_data(files)
 if df_all.empty:
     st.write("Nenhum dado encontrado.")
     st.stop()
 
-# colunas que queremos oferecer como filtros fixos
-colunas_filtro = ["SITUAÇÃO ESPECIAL", "DESCRIÇÃO", "NOME SETOR"]
-
 # sidebar para escolher filtros
 with st.sidebar:
     st.header("Filtros")
@@ -141,31 +394,57 @@ with st.sidebar:
         exact = st.radio("Tipo de busca:", ("Exata", "Contém")) == "Exata"
     # agora, para cada coluna de filtro fixa, vamos dar opções
     filtros = {}
-    for col in colunas_filtro:
-        if col in df_all.columns:
-            # obter valores únicos (poderia também ordenar / filtrar valores nulos)
-            opc = sorted(df_all[col].dropna().unique().tolist())
+    # categorias já vêm ordenadas e sem nulos — nenhum scan de unique()
+    opcoes = sidebar_options(files)
+    for col in COLUNAS_FILTRO:
+        if col in opcoes:
             # permitir múltiplas seleções?
-            sel = st.multiselect(f"Filtrar por {col}:", options=opc)
+            sel = st.multiselect(f"Filtrar por {col}:", options=opcoes[col])
             filtros[col] = sel  # lista vazia se nada selecionado
         else:
             filtros[col] = None
     # botão para executar busca / filtrar
     buscar = st.button("Buscar")
 
+@st.cache_data(show_spinner=False)
+def _to_csv_bytes(df: pd.DataFrame) -> bytes:
+    """Serializa o resultado para download — uma vez por resultado distinto."""
+    return df.to_csv(index=False, sep=";").encode("utf-8")
+
 # resultado: quando o usuário clicar em Buscar
+# tabela que apaga tudo que não for dígito 0-9 — str.translate é um filtro de
+# caracteres em C, bem mais rápido que re.sub(r"\D", ...) por chamada
+_DIGITS_ONLY = str.maketrans("", "", "".join(
+    chr(c) for c in range(256) if chr(c) not in "0123456789"
+))
+
 def clean_cnpj_digits(cnpj: str) -> str:
-    return re.sub(r"\D", "", str(cnpj or ""))
+    return str(cnpj or "").translate(_DIGITS_ONLY)
 
+@st.cache_resource
+def _brasilapi_session() -> requests.Session:
+    """
+    Sessão HTTP compartilhada com keep-alive: reutiliza a conexão TCP/TLS
+    com a BrasilAPI em vez de refazer o handshake a cada consulta.
+    """
+    s = requests.Session()
+    s.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+    return s
+
+@st.cache_data(ttl=3600, max_entries=512, show_spinner=False)
 def get_cnpj_data(cnpj: str) -> dict:
+    """
+    Consulta a BrasilAPI para um CNPJ (só dígitos) e retorna os dados.
+    Cacheado por CNPJ: re-selecionar o mesmo CNPJ (ou qualquer rerun) não
+    refaz a chamada HTTP dentro do TTL. Resposta não-200 vira HTTPError:
+    st.cache_data não memoriza exceções, então um erro transitório (429/500)
+    não fica preso no cache — a próxima seleção tenta de novo.
+    """
     url = f"https://brasilapi.com.br/api/cnpj/v1/{cnpj}"
     # ajusta se for sua cliente chamada “client.processor.get_data(...)”
-    resp = requests.get(url, timeout=10)
-    if resp.status_code == 200:
-        return resp.json()
-    else:
-        st.error(f"Erro ao consultar BrasilAPI: status {resp.status_code}")
-        return {}
+    resp = _brasilapi_session().get(url, timeout=10)
+    resp.raise_for_status()
+    return resp.json()
 
 def mostra_detalhes_cnpj(dados: dict):
     # Nome fantasia ou razão social
@@ -179,127 +458,81 @@ def mostra_detalhes_cnpj(dados: dict):
         "regime_tributario": "#B03A2E", # vermelho escuro
         "capital_social": "#884EA0"   # roxo escuro
     }
-    
-    # contêiner para alinhar itens lado a lado, opcional
-    col1, col2, col3 = st.columns(3)
-    
-    # Porte
+
+    def _card(cor: str, texto: str) -> str:
+        return (
+            f'<div style="background-color:{cor}; color: white; '
+            'padding: 8px 12px; border-radius: 8px; font-weight: bold; '
+            f'text-align: center; flex: 1; min-width: 200px;">{texto}</div>'
+        )
+
+    # um único bloco HTML (flexbox) em vez de um st.markdown por cartão:
+    # 1 mensagem no websocket e 1 reconciliação no cliente, sem st.columns
+    cards = []
     porte = dados.get("porte")
+    if porte:
+        cards.append(_card(cores["porte"], f"Porte: {porte}"))
     capital_social = dados.get("capital_social")
-    if porte or capital_social:
-        with col1:
-            st.markdown(
-                f"""
-                <div style="
-                    background-color:{cores['porte']};
-                    color: white;
-                    padding: 8px 12px;
-                    border-radius: 8px;
-                    font-weight: bold;
-                    text-align: center;
-                    margin-bottom: 5px;
-                ">
-                Porte: {porte}
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
-            st.markdown(
-                f"""
-                <div style="
-                    background-color:{cores['capital_social']};
-                    color: white;
-                    padding: 8px 12px;
-                    border-radius: 8px;
-                    font-weight: bold;
-                    text-align: center;
-                    margin-bottom: 5px;
-                ">
-                Capital Social: {capital_social}
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
-    
-    # Natureza Jurídica
+    if capital_social:
+        cards.append(_card(cores["capital_social"], f"Capital Social: {capital_social}"))
     natureza_juridica = dados.get("natureza_juridica")
     if natureza_juridica:
-        with col2:
-            st.markdown(
-                f"""
-                <div style="
-                    background-color:{cores['natureza_juridica']};
-                    color: white;
-                    padding: 8px 12px;
-                    border-radius: 8px;
-                    font-weight: bold;
-                    text-align: center;
-                    margin-bottom: 5px;
-                ">
-                Natureza Jurídica: {natureza_juridica}
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
-
-    
-    # Regime Tributário
+        cards.append(_card(cores["natureza_juridica"], f"Natureza Jurídica: {natureza_juridica}"))
     regime_tributario = dados.get("regime_tributario")
     if regime_tributario:
-        with col3:
-            st.markdown(
-                f"""
-                <div style="
-                    background-color:{cores['regime_tributario']};
-                    color: white;
-                    padding: 8px 12px;
-                    border-radius: 8px;
-                    font-weight: bold;
-                    text-align: center;
-                    margin-bottom: 5px;
-                ">
-                Regime Tributário: {regime_tributario}
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
+        cards.append(_card(cores["regime_tributario"], f"Regime Tributário: {regime_tributario}"))
+    if cards:
+        st.markdown(
+            '<div style="display: flex; gap: 8px; flex-wrap: wrap;">'
+            + "".join(cards)
+            + "</div>",
+            unsafe_allow_html=True
+        )
 
     # Sócios e administradores (QSA)
     qsa = dados.get("qsa")
     if qsa:
         st.subheader("Quadro de Sócios e Administradores (QSA)")
-        # transforma em DataFrame para exibir como tabela
-        df_qsa = pd.DataFrame(qsa)
-        # seleciona colunas mais úteis
-        colunas = ["nome_socio", "qualificacao_socio", "faixa_etaria", "data_entrada_sociedade"]
-        df_qsa = df_qsa[colunas]
+        # monta direto só as colunas exibidas — a BrasilAPI devolve 15+ campos
+        # por sócio que seriam materializados e descartados em seguida
+        colunas = ("nome_socio", "qualificacao_socio", "faixa_etaria", "data_entrada_sociedade")
+        df_qsa = pd.DataFrame([{k: socio.get(k) for k in colunas} for socio in qsa])
         st.dataframe(df_qsa, use_container_width=True)
 
 # --- quando o usuário clicar em Buscar, além de filtrar, salvamos no session_state ---
 if buscar:
-    df_filtrado = filter_data(
-        df_all,
-        filtros,
-        column_for_search=col_drop if col_drop else None,
-        query=query if query else None,
-        exact_match=exact
-    ).drop(columns=["_arquivo"], errors="ignore")
+    if USE_DUCKDB:
+        df_filtrado = filter_data_duckdb(
+            _duckdb_con(),
+            df_all,
+            filtros,
+            column_for_search=col_drop if col_drop else None,
+            query=query if query else None,
+            exact_match=exact
+        )
+    else:
+        df_filtrado = filter_data(
+            df_all,
+            filtros,
+            column_for_search=col_drop if col_drop else None,
+            query=query if query else None,
+            exact_match=exact,
+            df_lower=df_lower,
+            cat_codes=cat_codes,
+            search_index=_search_index(files)
+        )
 
     # salva no session_state para ser usado por outros widgets
     st.session_state.df_filtrado = df_filtrado
 
     # Criar opções de CNPJ (display -> cleaned digits) se a coluna existir
     if "CNPJ" in df_filtrado.columns:
-        unique = df_filtrado["CNPJ"].dropna().astype(str).str.strip().unique().tolist()
-        # mapping preserva o formato original para exibição e provê a versão sem pontuação para a API
-        cnpj_map = {"-- Selecione um CNPJ --": ""}
-        for c in unique:
-            c_display = c
-            c_api = clean_cnpj_digits(c)
-            # evite duplicatas: se já existir um c_api igual, prefira manter o display original
-            # (isso é opcional dependendo do seu CSV)
-            if c_display not in cnpj_map:
-                cnpj_map[c_display] = c_api
+        # mapping preserva o formato original para exibição e provê a versão
+        # sem pontuação para a API — tudo vetorizado: duas Series paralelas
+        # (display e dígitos) e um único dict(zip(...)), sem loop Python
+        s = df_filtrado["CNPJ"].dropna().astype(str).str.strip().drop_duplicates()
+        digits = s.str.translate(_DIGITS_ONLY)
+        cnpj_map = {"-- Selecione um CNPJ --": "", **dict(zip(s, digits))}
 
         st.session_state.cnpj_map = cnpj_map
         st.session_state.cnpj_options = list(cnpj_map.keys())
@@ -307,6 +540,12 @@ if buscar:
         st.session_state.cnpj_map = {"-- Selecione um CNPJ --": ""}
         st.session_state.cnpj_options = ["-- Selecione um CNPJ --"]
 
+    # display -> posição na lista: o selectbox acha o índice com um lookup
+    # O(1) em vez de um .index() linear a cada rerun
+    st.session_state.cnpj_index_map = {
+        display: i for i, display in enumerate(st.session_state.cnpj_options)
+    }
+
     # inicializar selected_cnpj se não existir
     if "selected_cnpj" not in st.session_state:
         st.session_state.selected_cnpj = "-- Selecione um CNPJ --"
@@ -314,8 +553,14 @@ if buscar:
     # mostrar resultados na página
     st.write(f"Resultados encontrados: {len(df_filtrado)} registros")
     st.dataframe(df_filtrado)
-    csv = df_filtrado.to_csv(index=False, sep=";", encoding="utf-8")
-    st.download_button("Download CSV", data=csv, file_name="resultado.csv", mime="text/csv")
+    # o callable adia a serialização para o momento do clique no botão;
+    # o cache garante uma única formatação por resultado distinto
+    st.download_button(
+        "Download CSV",
+        data=lambda: _to_csv_bytes(df_filtrado),
+        file_name="resultado.csv",
+        mime="text/csv",
+    )
 
 else:
     # se não clicou em buscar, mas já existe df_filtrado no estado (ex.: busca anterior), use-o
@@ -329,15 +574,17 @@ else:
 # Bloco BrasilAPI (pode ficar fora do if buscar; depende do session_state atualizado)
 # ---------------------------
 if "df_filtrado" in st.session_state and "CNPJ" in st.session_state.df_filtrado.columns:
-    # garante que cnpj_options exista
+    # garante que cnpj_options/cnpj_index_map existam
     st.session_state.cnpj_options = st.session_state.get("cnpj_options", ["-- Selecione um CNPJ --"])
+    st.session_state.cnpj_index_map = st.session_state.get("cnpj_index_map", {"-- Selecione um CNPJ --": 0})
     # selectbox usa as opções geradas anteriormente
     selected = st.sidebar.selectbox(
         "Escolha um CNPJ para ver detalhes:",
         st.session_state.cnpj_options,
-        index=st.session_state.cnpj_options.index(st.session_state.get("selected_cnpj", "-- Selecione um CNPJ --")) 
-            if st.session_state.get("selected_cnpj") in st.session_state.cnpj_options else 0,
-        key="cnpj_select", 
+        index=st.session_state.cnpj_index_map.get(
+            st.session_state.get("selected_cnpj", "-- Selecione um CNPJ --"), 0
+        ),
+        key="cnpj_select",
     )
 
     # atualiza valor selecionado no estado (display string)
@@ -354,6 +601,9 @@ if "df_filtrado" in st.session_state and "CNPJ" in st.session_state.df_filtrado.
         with st.spinner(f"Consultando BrasilAPI para {cnpj_display}..."):
             try:
                 dados = get_cnpj_data(cnpj_api)  # usa cnpj só com dígitos
+            except requests.HTTPError as e:
+                st.error(f"Erro ao consultar BrasilAPI: status {e.response.status_code}")
+                dados = {}
             except Exception as e:
                 st.error(f"Erro BrasilAPI: {e}")
                 dados = {}